@@ -28,9 +28,18 @@ from rustree.accessors import (
     SequenceEntry,
     StructSequenceEntry,
 )
-from rustree.ops import tree_is_leaf
+from rustree.ops import (
+    arg_tree_leaves,
+    tree_flatten,
+    tree_is_leaf,
+    tree_leaves,
+    tree_leaves_cached,
+    tree_structure,
+    tree_unflatten,
+)
 from rustree.typing import (
     PyTreeKind,
+    PyTreeSpec,
     is_namedtuple,
     is_namedtuple_class,
     is_namedtuple_instance,
@@ -44,8 +53,15 @@ from rustree.typing import (
 
 __all__ = [
     # Tree operations
+    'tree_flatten',
+    'tree_unflatten',
+    'tree_leaves',
+    'tree_leaves_cached',
+    'tree_structure',
     'tree_is_leaf',
+    'arg_tree_leaves',
     # Typing
+    'PyTreeSpec',
     'PyTreeKind',
     'is_namedtuple',
     'is_namedtuple_class',
@@ -16,7 +16,8 @@
 # pylint: disable=all
 
 import enum
-from collections.abc import Callable, Collection
+from collections.abc import Callable, Collection, Iterable
+from typing import Any
 
 from rustree.typing import (
     FlattenFunc,
@@ -29,12 +30,48 @@ from rustree.typing import (
 Py_TPFLAGS_BASETYPE: int  # (1UL << 10)
 
 def is_leaf(
-    obj: T,
+    tree: T,
     /,
-    leaf_predicate: Callable[[T], bool] | None = None,
+    is_leaf: Callable[[T], bool] | None = None,
+    *,
     none_is_leaf: bool = False,
     namespace: str = '',
 ) -> bool: ...
+def flatten(
+    tree: T,
+    /,
+    is_leaf: Callable[[T], bool] | None = None,
+    *,
+    none_is_leaf: bool = False,
+    namespace: str = '',
+    memoize_is_leaf: bool = False,
+) -> tuple[list[T], PyTreeSpec]: ...
+def leaves(
+    tree: T,
+    /,
+    is_leaf: Callable[[T], bool] | None = None,
+    *,
+    none_is_leaf: bool = False,
+    namespace: str = '',
+    memoize_is_leaf: bool = False,
+) -> list[T]: ...
+def structure(
+    tree: T,
+    /,
+    is_leaf: Callable[[T], bool] | None = None,
+    *,
+    none_is_leaf: bool = False,
+    namespace: str = '',
+    memoize_is_leaf: bool = False,
+) -> PyTreeSpec: ...
+def arg_leaves(
+    args: tuple[Any, ...],
+    kwargs: dict[str, Any],
+    /,
+    *,
+    none_is_leaf: bool = False,
+    namespace: str = '',
+) -> list[Any]: ...
 def is_namedtuple(obj: object | type, /) -> bool: ...
 def is_namedtuple_instance(obj: object, /) -> bool: ...
 def is_namedtuple_class(cls: type, /) -> bool: ...
@@ -57,6 +94,26 @@ class PyTreeKind(enum.IntEnum):
     DEQUE = enum.auto()  # a collections.deque
     STRUCTSEQUENCE = enum.auto()  # a PyStructSequence
 
+class PyTreeSpec:
+    @property
+    def num_nodes(self, /) -> int: ...
+    @property
+    def num_leaves(self, /) -> int: ...
+    @property
+    def num_children(self, /) -> int: ...
+    @property
+    def none_is_leaf(self, /) -> bool: ...
+    @property
+    def namespace(self, /) -> str: ...
+    @property
+    def kind(self, /) -> PyTreeKind: ...
+    def flatten_up_to(self, full_tree: Any, /) -> list[Any]: ...
+    def unflatten(self, leaves: Iterable[T], /) -> Any: ...
+    def __eq__(self, other: object, /) -> bool: ...
+    def __ne__(self, other: object, /) -> bool: ...
+    def __hash__(self, /) -> int: ...
+    def __len__(self, /) -> int: ...
+
 def register_node(
     cls: type[Collection[T]],
     /,
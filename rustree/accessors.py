@@ -20,7 +20,6 @@ import dataclasses
 import sys
 from collections.abc import Iterable, Mapping, Sequence
 from typing import TYPE_CHECKING, Any, ClassVar, Generic, Literal, TypeVar, overload
-from typing_extensions import Self  # Python 3.11+
 
 import rustree._rs as _rs
 from rustree._rs import PyTreeKind
@@ -28,6 +27,7 @@ from rustree._rs import PyTreeKind
 
 if TYPE_CHECKING:
     import builtins
+    from typing_extensions import Self  # Python 3.11+
 
     from rustree.typing import NamedTuple, StructSequence
 
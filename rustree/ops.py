@@ -16,57 +16,118 @@
 
 from __future__ import annotations
 
-from typing import TYPE_CHECKING, TypeVar
+from typing import TYPE_CHECKING, Any, TypeVar
 
 import rustree._rs as _rs
 
 
 if TYPE_CHECKING:
-    from collections.abc import Callable
+    from collections.abc import Iterable
+
+    from rustree.typing import PyTreeSpec
 
 
 __all__ = [
+    'tree_flatten',
+    'tree_unflatten',
+    'tree_leaves',
+    'tree_leaves_cached',
+    'tree_structure',
     'tree_is_leaf',
+    'arg_tree_leaves',
 ]
 
 
 _T = TypeVar('_T')
 
 
-def tree_is_leaf(
-    tree: _T,
-    /,
-    is_leaf: Callable[[_T], bool] | None = None,
-    *,
-    none_is_leaf: bool = False,
-    namespace: str = '',
-) -> bool:
-    """Test whether the given object is a leaf node.
+# These operations are the Rust functions themselves rather than forwarding wrappers, so calling
+# them costs no extra Python frame. Their docstrings and signatures are defined in the extension.
+tree_flatten = _rs.flatten
+tree_leaves = _rs.leaves
+tree_structure = _rs.structure
+tree_is_leaf = _rs.is_leaf
 
-    See also :func:`tree_flatten`, :func:`tree_leaves`, and :func:`all_leaves`.
 
-    >>> tree_is_leaf(1)
-    True
-    >>> tree_is_leaf(None)
-    False
-    >>> tree_is_leaf(None, none_is_leaf=True)
+def tree_unflatten(treespec: PyTreeSpec, leaves: Iterable[_T]) -> Any:
+    """Reconstruct a pytree from the treespec and the leaves.
+
+    The inverse of :func:`tree_flatten`.
+
+    >>> tree = {'b': (2, [3, 4]), 'a': 1, 'c': None, 'd': 5}
+    >>> leaves, treespec = tree_flatten(tree)
+    >>> tree == tree_unflatten(treespec, leaves)
     True
-    >>> tree_is_leaf({'a': 1, 'b': (2, 3)})
-    False
 
     Args:
-        tree (pytree): A pytree to check if it is a leaf node.
-        is_leaf (callable, optional): An optionally specified function that will be called at each
-            flattening step. It should return a boolean, with :data:`True` stopping the traversal
-            and the whole subtree being treated as a leaf, and :data:`False` indicating the
-            flattening should traverse the current object.
-        none_is_leaf (bool, optional): Whether to treat :data:`None` as a leaf. If :data:`False`,
-            :data:`None` is a non-leaf node with arity 0. Thus :data:`None` is contained in the
-            treespec rather than a leaf. (default: :data:`False`)
-        namespace (str, optional): The registry namespace used for custom pytree node types.
-            (default: :const:`''`, i.e., the global namespace)
+        treespec (PyTreeSpec): The treespec to reconstruct.
+        leaves (iterable): The list of leaves to use for reconstruction. The list must match the
+            number of leaves of the treespec.
+
+    Returns:
+        The reconstructed pytree, containing the ``leaves`` placed in the structure described by
+        ``treespec``.
+    """
+    return treespec.unflatten(leaves)
+
+
+def tree_leaves_cached(tree: _T, treespec: PyTreeSpec, /) -> list[_T]:
+    """Get the leaves of a pytree whose structure is known in advance.
+
+    See also :func:`tree_leaves` and :meth:`PyTreeSpec.flatten_up_to`.
+
+    This is the fast path for flattening a stream of pytrees that share the same structure, e.g., the
+    parameters or the optimizer states in a training loop. The traversal follows the given treespec
+    rather than resolving the node type of each subtree through the registry. The internal nodes of
+    the pytree are validated against the treespec, including their types, arities, dict keys, and
+    node data. Like :meth:`PyTreeSpec.flatten_up_to`, the object at each leaf position of the
+    treespec is returned as is, even if it is a subtree rather than a leaf.
+
+    >>> treespec = tree_structure({'b': (2, [3, 4]), 'a': 1, 'c': None, 'd': 5})
+    >>> tree_leaves_cached({'b': (6, [7, 8]), 'a': 9, 'c': None, 'd': 0}, treespec)
+    [9, 6, 7, 8, 0]
+    >>> tree_leaves_cached({'b': (6, [7, 8]), 'a': 9}, treespec)
+    Traceback (most recent call last):
+        ...
+    ValueError: Dictionary key mismatch; expected key(s): ('a', 'b', 'c', 'd'), got key(s): ['b', 'a'].
+    >>> tree_leaves_cached({'a': [1, 2]}, tree_structure({'a': 0}))
+    [[1, 2]]
+    >>> from collections import deque
+    >>> tree_leaves_cached(deque([1, 2]), tree_structure(deque([0, 0], maxlen=2)))
+    Traceback (most recent call last):
+        ...
+    ValueError: Mismatch maximum length of deque; expected: 2, got: None.
+
+    Args:
+        tree (pytree): A pytree to iterate over. It should have the same structure as ``treespec``.
+        treespec (PyTreeSpec): The treespec of the pytree.
+
+    Returns:
+        A list of leaf values.
+    """
+    return treespec.flatten_up_to(tree)
+
+
+def arg_tree_leaves(*args: Any, **kwargs: Any) -> list[Any]:
+    """Get the leaves of the positional and keyword arguments of a function call.
+
+    See also :func:`tree_leaves`.
+
+    This is equivalent to ``tree_leaves((args, kwargs))`` but does not construct and traverse the
+    outer tuple and dict. It is useful for collecting the leaves of the arguments of each call in a
+    dispatching function.
+
+    >>> arg_tree_leaves(1, (2, [3, 4]), b=5, a=None)
+    [1, 2, 3, 4, 5]
+    >>> tree_leaves(((1, (2, [3, 4])), {'b': 5, 'a': None}))
+    [1, 2, 3, 4, 5]
+
+    Args:
+        *args (pytree): The positional arguments.
+        **kwargs (pytree): The keyword arguments.
 
     Returns:
-        A boolean indicating if the given object is a leaf node.
+        A list of leaf values of the arguments, with the keyword arguments flattened in the key
+        order of :func:`tree_leaves`.
     """
-    return _rs.is_leaf(tree, is_leaf, none_is_leaf, namespace)
+    return _rs.arg_leaves(args, kwargs)
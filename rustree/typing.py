@@ -17,8 +17,6 @@
 from __future__ import annotations
 
 import abc
-import functools
-import platform
 import sys
 import types
 from builtins import dict as Dict  # noqa: N812
@@ -34,6 +32,7 @@ from collections.abc import (
     Sequence,
 )
 from typing import (
+    TYPE_CHECKING,
     Any,
     Callable,
     ClassVar,
@@ -44,16 +43,9 @@ from typing import (
     final,
     runtime_checkable,
 )
-from typing_extensions import (
-    NamedTuple,  # Generic NamedTuple: Python 3.11+
-    Never,  # Python 3.11+
-    ParamSpec,  # Python 3.10+
-    Self,  # Python 3.11+
-    TypeAlias,  # Python 3.10+
-)
 
 import rustree._rs as _rs
-from rustree._rs import PyTreeKind
+from rustree._rs import PyTreeKind, PyTreeSpec
 from rustree.accessors import (
     AutoEntry,
     DataclassEntry,
@@ -69,7 +61,24 @@ from rustree.accessors import (
 )
 
 
+if sys.version_info >= (3, 11):
+    from typing import NamedTuple, ParamSpec
+else:
+    from typing_extensions import (
+        NamedTuple,  # Generic NamedTuple: Python 3.11+
+        ParamSpec,  # Python 3.10+
+    )
+
+if TYPE_CHECKING:
+    from typing_extensions import (
+        Never,  # Python 3.11+
+        Self,  # Python 3.11+
+        TypeAlias,  # Python 3.10+
+    )
+
+
 __all__ = [
+    'PyTreeSpec',
     'PyTreeKind',
     'Children',
     'MetaData',
@@ -172,7 +181,11 @@ def _override_with_(
     rust_implementation: Callable[P, T],
     /,
 ) -> Callable[[Callable[P, T]], Callable[P, T]]:
-    """Decorator to override the Python implementation with the C++ implementation.
+    """Decorator to override the Python implementation with the Rust implementation.
+
+    The decorated name is bound to the Rust implementation itself rather than a forwarding wrapper,
+    so calling it costs no extra Python frame. The Python implementation serves as the reference
+    for the behavior and the type signature.
 
     >>> @_override_with_(any)
     ... def my_any(iterable):
@@ -183,17 +196,13 @@ def _override_with_(
     ...
     >>> my_any([False, False, True, False, False, True])  # run at C speed
     True
+    >>> my_any is any
+    True
     """
 
+    # pylint: disable-next=unused-argument
     def wrapper(python_implementation: Callable[P, T], /) -> Callable[P, T]:
-        @functools.wraps(python_implementation)
-        def wrapped(*args: P.args, **kwargs: P.kwargs) -> T:
-            return rust_implementation(*args, **kwargs)
-
-        wrapped.__rust_implementation__ = rust_implementation  # type: ignore[attr-defined]
-        wrapped.__python_implementation__ = python_implementation  # type: ignore[attr-defined]
-
-        return wrapped
+        return rust_implementation
 
     return wrapper
 
@@ -331,7 +340,7 @@ def is_structseq_class(cls: type, /) -> bool:
         and isinstance(getattr(cls, 'n_unnamed_fields', None), int)
     ):
         # Check the type does not allow subclassing
-        if platform.python_implementation() == 'PyPy':
+        if sys.implementation.name == 'pypy':
             try:
                 types.new_class('subclass', bases=(cls,))
             except (AssertionError, TypeError):
@@ -357,7 +366,7 @@ def structseq_fields(obj: tuple | type[tuple], /) -> tuple[str, ...]:
         if not is_structseq_class(cls):
             raise TypeError(f'Expected an instance of PyStructSequence type, got {obj!r}.')
 
-    if platform.python_implementation() == 'PyPy':
+    if sys.implementation.name == 'pypy':
         indices_by_name = {
             name: member.index  # type: ignore[attr-defined]
             for name, member in vars(cls).items()
@@ -23,6 +23,7 @@ mod rustree;
 fn build_extension(m: &Bound<PyModule>) -> PyResult<()> {
     m.add("Py_TPFLAGS_BASETYPE", ffi::Py_TPFLAGS_BASETYPE)?;
     m.add_class::<rustree::PyTreeKind>()?;
+    m.add_class::<rustree::PyTreeSpec>()?;
     m.add_function(wrap_pyfunction!(rustree::is_namedtuple, m)?)?;
     m.add_function(wrap_pyfunction!(rustree::is_namedtuple_instance, m)?)?;
     m.add_function(wrap_pyfunction!(rustree::is_namedtuple_class, m)?)?;
@@ -36,5 +37,9 @@ fn build_extension(m: &Bound<PyModule>) -> PyResult<()> {
     m.add_function(wrap_pyfunction!(rustree::is_dict_insertion_ordered, m)?)?;
     m.add_function(wrap_pyfunction!(rustree::set_dict_insertion_ordered, m)?)?;
     m.add_function(wrap_pyfunction!(rustree::treespec::is_leaf, m)?)?;
+    m.add_function(wrap_pyfunction!(rustree::treespec::flatten, m)?)?;
+    m.add_function(wrap_pyfunction!(rustree::treespec::leaves, m)?)?;
+    m.add_function(wrap_pyfunction!(rustree::treespec::structure, m)?)?;
+    m.add_function(wrap_pyfunction!(rustree::treespec::arg_leaves, m)?)?;
     Ok(())
 }
@@ -22,3 +22,4 @@ pub use pytypes::{is_structseq, is_structseq_class, is_structseq_instance, struc
 pub use registry::PyTreeKind;
 pub use registry::{is_dict_insertion_ordered, set_dict_insertion_ordered};
 pub use registry::{register_node, unregister_node};
+pub use treespec::PyTreeSpec;
@@ -13,20 +13,106 @@
 // limitations under the License.
 // =============================================================================
 
+use once_cell::sync::Lazy;
 use pyo3::exceptions::PyTypeError;
 use pyo3::ffi;
 use pyo3::prelude::*;
 use pyo3::types::*;
+use std::collections::HashMap;
+use std::sync::{Mutex, PoisonError};
+
+// Whether a class is a PyStructSequence and the layout of its fields are fixed at class creation:
+// the type flags and bases cannot change, and the attributes of these static types are read-only.
+// So both the positive and the negative results are cached per class. A namedtuple is only
+// recognized by its `_fields`, `_make` and `_asdict` attributes, which may be assigned after the
+// class is created, e.g., by a class decorator. Only the positive namedtuple results are cached,
+// so a class probed before these attributes are set is checked again on the next lookup. Deleting
+// the attributes from a class that was already recognized as a namedtuple is not detected. The
+// entries hold weak references to the classes to detect when the address of a dead class is
+// reused.
+type ClassCache<V> = Lazy<Mutex<HashMap<usize, (Py<PyWeakrefReference>, V)>>>;
+
+const CLASS_CACHE_SIZE: usize = 4096;
+
+static NAMEDTUPLE_CLASS_CACHE: ClassCache<()> = Lazy::new(|| Mutex::new(HashMap::new()));
+static STRUCTSEQ_CLASS_CACHE: ClassCache<bool> = Lazy::new(|| Mutex::new(HashMap::new()));
+static STRUCTSEQ_FIELDS_CACHE: ClassCache<Py<PyTuple>> = Lazy::new(|| Mutex::new(HashMap::new()));
 
 #[inline]
-fn is_namedtuple_class_impl(cls: &Bound<PyType>) -> bool {
-    // We can only identify namedtuples heuristically, here by the presence of a _fields attribute.
-    if unsafe {
+fn is_tuple_subclass(cls: &Bound<PyType>) -> bool {
+    unsafe {
         ffi::PyType_FastSubclass(
             cls.as_ptr() as *mut ffi::PyTypeObject,
             ffi::Py_TPFLAGS_TUPLE_SUBCLASS,
         ) != 0
-    } {
+    }
+}
+
+fn class_cache_get<V, R>(
+    cache: &'static ClassCache<V>,
+    cls: &Bound<PyType>,
+    fetch: impl FnOnce(&V) -> R,
+) -> Option<R> {
+    let py = cls.py();
+    // No Python code is run while holding the lock
+    cache
+        .lock()
+        .unwrap_or_else(PoisonError::into_inner)
+        .get(&(cls.as_ptr() as usize))
+        .and_then(|(weakref, value)| weakref.bind(py).upgrade().map(|_| fetch(value)))
+}
+
+fn class_cache_insert<V>(cache: &'static ClassCache<V>, cls: &Bound<PyType>, value: V) {
+    if let Ok(weakref) = PyWeakrefReference::new(cls) {
+        // Dropping the stale entries may run arbitrary Python code, do it after releasing the lock
+        let evicted = {
+            let mut cache = cache.lock().unwrap_or_else(PoisonError::into_inner);
+            let evicted = if cache.len() >= CLASS_CACHE_SIZE {
+                std::mem::take(&mut *cache)
+            } else {
+                HashMap::new()
+            };
+            (
+                evicted,
+                cache.insert(cls.as_ptr() as usize, (weakref.unbind(), value)),
+            )
+        };
+        drop(evicted);
+    }
+}
+
+fn cached_class_check(
+    cache: &'static ClassCache<bool>,
+    cls: &Bound<PyType>,
+    check: fn(&Bound<PyType>) -> bool,
+) -> bool {
+    if let Some(result) = class_cache_get(cache, cls, |result| *result) {
+        return result;
+    }
+    let result = check(cls);
+    class_cache_insert(cache, cls, result);
+    result
+}
+
+#[inline]
+fn is_namedtuple_class_impl(cls: &Bound<PyType>) -> bool {
+    // Only tuple subclasses can be namedtuples, check the type flags before the cache
+    if !is_tuple_subclass(cls) {
+        return false;
+    }
+    if class_cache_get(&NAMEDTUPLE_CLASS_CACHE, cls, |_| ()).is_some() {
+        return true;
+    }
+    let result = check_namedtuple_class(cls);
+    if result {
+        class_cache_insert(&NAMEDTUPLE_CLASS_CACHE, cls, ());
+    }
+    result
+}
+
+fn check_namedtuple_class(cls: &Bound<PyType>) -> bool {
+    // We can only identify namedtuples heuristically, here by the presence of a _fields attribute.
+    if is_tuple_subclass(cls) {
         let fields = match cls.getattr("_fields") {
             Ok(fields) => fields,
             Err(_) => {
@@ -64,6 +150,7 @@ fn is_namedtuple_class_impl(cls: &Bound<PyType>) -> bool {
     false
 }
 
+/// Return whether the class is a subclass of namedtuple.
 #[pyfunction]
 #[pyo3(signature = (cls, /))]
 #[inline]
@@ -71,6 +158,7 @@ pub fn is_namedtuple_class(cls: &Bound<PyAny>) -> PyResult<bool> {
     Ok(cls.is_instance_of::<PyType>() && is_namedtuple_class_impl(cls.downcast::<PyType>()?))
 }
 
+/// Return whether the object is an instance of namedtuple.
 #[pyfunction]
 #[pyo3(signature = (obj, /))]
 #[inline]
@@ -78,6 +166,7 @@ pub fn is_namedtuple_instance(obj: &Bound<PyAny>) -> PyResult<bool> {
     Ok(!obj.is_instance_of::<PyType>() && is_namedtuple_class_impl(&obj.get_type()))
 }
 
+/// Return the field names of a namedtuple.
 #[pyfunction]
 #[pyo3(signature = (obj, /))]
 #[inline]
@@ -100,6 +189,7 @@ pub fn namedtuple_fields<'py>(obj: &Bound<'py, PyAny>) -> PyResult<Bound<'py, Py
     cls.getattr("_fields")?.extract()
 }
 
+/// Return whether the object is an instance of namedtuple or a subclass of namedtuple.
 #[pyfunction]
 #[pyo3(signature = (obj, /))]
 #[inline]
@@ -114,6 +204,11 @@ pub fn is_namedtuple(obj: &Bound<PyAny>) -> PyResult<bool> {
 
 #[inline]
 fn is_structseq_class_impl(cls: &Bound<PyType>) -> bool {
+    // Only tuple subclasses can be structseqs, check the type flags before the cache
+    is_tuple_subclass(cls) && cached_class_check(&STRUCTSEQ_CLASS_CACHE, cls, check_structseq_class)
+}
+
+fn check_structseq_class(cls: &Bound<PyType>) -> bool {
     let type_ptr: *mut ffi::PyTypeObject = cls.as_type_ptr();
     if unsafe {
         ffi::PyType_IsSubtype(type_ptr, std::ptr::addr_of_mut!(ffi::PyTuple_Type)) != 0
@@ -142,6 +237,7 @@ fn is_structseq_class_impl(cls: &Bound<PyType>) -> bool {
     false
 }
 
+/// Return whether the class is a class of PyStructSequence.
 #[pyfunction]
 #[pyo3(signature = (cls, /))]
 #[inline]
@@ -149,6 +245,7 @@ pub fn is_structseq_class(cls: &Bound<PyAny>) -> PyResult<bool> {
     Ok(cls.is_instance_of::<PyType>() && is_structseq_class_impl(cls.downcast::<PyType>()?))
 }
 
+/// Return whether the object is an instance of PyStructSequence.
 #[pyfunction]
 #[pyo3(signature = (obj, /))]
 #[inline]
@@ -156,6 +253,7 @@ pub fn is_structseq_instance(obj: &Bound<PyAny>) -> PyResult<bool> {
     Ok(!obj.is_instance_of::<PyType>() && is_structseq_class_impl(&obj.get_type()))
 }
 
+/// Return whether the object is an instance of PyStructSequence or a class of PyStructSequence.
 #[pyfunction]
 #[pyo3(signature = (obj, /))]
 #[inline]
@@ -170,6 +268,18 @@ pub fn is_structseq(obj: &Bound<PyAny>) -> PyResult<bool> {
 
 #[inline]
 fn structseq_fields_impl<'py>(cls: &Bound<'py, PyType>) -> PyResult<Bound<'py, PyTuple>> {
+    let py = cls.py();
+    if let Some(fields) = class_cache_get(&STRUCTSEQ_FIELDS_CACHE, cls, |fields| {
+        fields.bind(py).clone()
+    }) {
+        return Ok(fields);
+    }
+    let fields = compute_structseq_fields(cls)?;
+    class_cache_insert(&STRUCTSEQ_FIELDS_CACHE, cls, fields.clone().unbind());
+    Ok(fields)
+}
+
+fn compute_structseq_fields<'py>(cls: &Bound<'py, PyType>) -> PyResult<Bound<'py, PyTuple>> {
     let py = cls.py();
     let fields = PyList::empty(py);
 
@@ -216,6 +326,7 @@ fn structseq_fields_impl<'py>(cls: &Bound<'py, PyType>) -> PyResult<Bound<'py, P
     Ok(fields.to_tuple())
 }
 
+/// Return the field names of a PyStructSequence.
 #[pyfunction]
 #[pyo3(signature = (obj, /))]
 #[inline]
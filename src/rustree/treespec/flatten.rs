@@ -13,29 +13,771 @@
 // limitations under the License.
 // =============================================================================
 
+use pyo3::exceptions::{PyKeyError, PyRecursionError, PyTypeError, PyValueError};
 use pyo3::prelude::*;
+use pyo3::sync::PyOnceLock;
+use pyo3::types::*;
+use std::cell::RefCell;
+use std::collections::HashMap;
+use std::sync::Arc;
+use std::sync::atomic::{AtomicUsize, Ordering};
 
 use crate::rustree::pytypes::{is_namedtuple_class, is_structseq_class};
-use crate::rustree::registry::PyTreeTypeRegistry;
+use crate::rustree::registry::{PyTreeKind, PyTreeTypeRegistration, PyTreeTypeRegistry};
+use crate::rustree::treespec::{Node, PyTreeSpec, Traversal, new_list};
 
+const MAX_RECURSION_DEPTH: usize = 1000;
+
+static TOTAL_ORDER_SORTED: PyOnceLock<Py<PyAny>> = PyOnceLock::new();
+
+// The number of leaves of the last flattened tree, used to reserve the leaves buffer of the next
+// call. Repeated calls usually flatten trees of the same structure. The buffer only lives for the
+// duration of the call, and the reservation is capped so that a single huge tree does not make
+// every following call allocate a large buffer.
+const MAX_RESERVED_CAPACITY: usize = 1 << 10;
+
+static LAST_NUM_LEAVES: AtomicUsize = AtomicUsize::new(0);
+
+#[inline]
+fn reserved_capacity() -> usize {
+    LAST_NUM_LEAVES
+        .load(Ordering::Relaxed)
+        .min(MAX_RESERVED_CAPACITY)
+}
+
+#[inline]
+fn record(num_leaves: usize) {
+    LAST_NUM_LEAVES.store(num_leaves, Ordering::Relaxed);
+}
+
+/// Test whether the given object is a leaf node.
+///
+/// See also :func:`tree_flatten`, :func:`tree_leaves`, and :func:`all_leaves`.
+///
+/// >>> tree_is_leaf(1)
+/// True
+/// >>> tree_is_leaf(None)
+/// False
+/// >>> tree_is_leaf(None, none_is_leaf=True)
+/// True
+/// >>> tree_is_leaf({'a': 1, 'b': (2, 3)})
+/// False
+///
+/// Args:
+///     tree (pytree): A pytree to check if it is a leaf node.
+///     is_leaf (callable, optional): An optionally specified function that will be called at each
+///         flattening step. It should return a boolean, with :data:`True` stopping the traversal
+///         and the whole subtree being treated as a leaf, and :data:`False` indicating the
+///         flattening should traverse the current object.
+///     none_is_leaf (bool, optional): Whether to treat :data:`None` as a leaf. If :data:`False`,
+///         :data:`None` is a non-leaf node with arity 0. Thus :data:`None` is contained in the
+///         treespec rather than a leaf. (default: :data:`False`)
+///     namespace (str, optional): The registry namespace used for custom pytree node types.
+///         (default: :const:`''`, i.e., the global namespace)
+///
+/// Returns:
+///     A boolean indicating if the given object is a leaf node.
 #[pyfunction]
-#[pyo3(signature = (obj, /, leaf_predicate=None, none_is_leaf=false, namespace=""))]
+#[pyo3(signature = (tree, /, is_leaf=None, *, none_is_leaf=false, namespace=""))]
 #[inline]
 pub fn is_leaf(
-    obj: &Bound<PyAny>,
-    leaf_predicate: Option<&Bound<PyAny>>,
+    tree: &Bound<PyAny>,
+    is_leaf: Option<&Bound<PyAny>>,
     none_is_leaf: Option<bool>,
     namespace: Option<&str>,
 ) -> PyResult<bool> {
-    let cls = obj.get_type();
-    if leaf_predicate.is_some() {
-        let result = leaf_predicate.unwrap().call1((obj,))?;
-        if result.is_truthy()? {
+    if let Some(is_leaf) = is_leaf {
+        if is_leaf.call1((tree,))?.is_truthy()? {
             return Ok(true);
         }
     }
-    if PyTreeTypeRegistry::lookup(&cls, none_is_leaf, namespace).is_some() {
-        return Ok(false);
+    // The common built-in nodes are answered by their exact type without resolving the registry
+    let none_is_leaf = none_is_leaf.unwrap_or(false);
+    if let Some(kind) = builtin_kind(tree, none_is_leaf) {
+        return Ok(kind == PyTreeKind::Leaf);
+    }
+    let (kind, _) = get_kind(tree, none_is_leaf, namespace.unwrap_or(""))?;
+    Ok(kind == PyTreeKind::Leaf)
+}
+
+// Fast path for the most common built-in containers. These types cannot be re-registered in any
+// namespace and their nodes do not keep the registration, so the registry lookup can be skipped.
+// Subclasses are not handled here.
+#[inline]
+fn builtin_kind(obj: &Bound<PyAny>, none_is_leaf: bool) -> Option<PyTreeKind> {
+    if obj.is_exact_instance_of::<PyList>() {
+        Some(PyTreeKind::List)
+    } else if obj.is_exact_instance_of::<PyTuple>() {
+        Some(PyTreeKind::Tuple)
+    } else if obj.is_exact_instance_of::<PyDict>() {
+        Some(PyTreeKind::Dict)
+    } else if obj.is_none() {
+        Some(if none_is_leaf {
+            PyTreeKind::Leaf
+        } else {
+            PyTreeKind::None
+        })
+    } else {
+        None
+    }
+}
+
+#[inline]
+fn get_kind(
+    obj: &Bound<PyAny>,
+    none_is_leaf: bool,
+    namespace: &str,
+) -> PyResult<(PyTreeKind, Option<Arc<PyTreeTypeRegistration>>)> {
+    if let Some(kind) = builtin_kind(obj, none_is_leaf) {
+        return Ok((kind, None));
+    }
+
+    let cls = obj.get_type();
+    // Look up the registry per node rather than holding a reference to it for the whole call. The
+    // flatten functions and the leaf predicate may register or unregister node types.
+    if let Some(registration) =
+        PyTreeTypeRegistry::lookup(&cls, Some(none_is_leaf), Some(namespace))
+    {
+        return Ok((registration.kind, Some(registration)));
+    }
+    if is_structseq_class(&cls)? {
+        return Ok((PyTreeKind::StructSequence, None));
+    }
+    if is_namedtuple_class(&cls)? {
+        return Ok((PyTreeKind::NamedTuple, None));
+    }
+    Ok((PyTreeKind::Leaf, None))
+}
+
+#[inline]
+fn total_order_sorted_keys<'py>(keys: Bound<'py, PyList>) -> PyResult<Bound<'py, PyList>> {
+    let py = keys.py();
+    match keys.sort() {
+        Ok(()) => Ok(keys),
+        Err(err) if err.is_instance_of::<PyTypeError>(py) => {
+            // Keys of mixed types are not comparable, fallback to the total order sort in Python
+            let total_order_sorted = TOTAL_ORDER_SORTED.get_or_try_init(py, || {
+                Ok::<_, PyErr>(
+                    py.import("rustree.utils")?
+                        .getattr("total_order_sorted")?
+                        .unbind(),
+                )
+            })?;
+            Ok(total_order_sorted
+                .bind(py)
+                .call1((keys,))?
+                .downcast_into::<PyList>()?)
+        }
+        Err(err) => Err(err),
+    }
+}
+
+// `list.sort` checks once whether all keys have the same type and then compares `str` keys
+// directly, with `memcmp` for latin-1 strings, so sorting the keys in Rust does not pay off
+fn sorted_keys<'py>(dict: &Bound<'py, PyDict>) -> PyResult<Bound<'py, PyTuple>> {
+    let keys = dict.keys();
+    if keys.len() <= 1 {
+        return Ok(keys.to_tuple());
+    }
+    Ok(total_order_sorted_keys(keys)?.to_tuple())
+}
+
+#[inline]
+fn dict_values<'py>(
+    dict: &Bound<'py, PyDict>,
+    keys: &Bound<'py, PyTuple>,
+) -> PyResult<Vec<Bound<'py, PyAny>>> {
+    keys.iter()
+        .map(|key| {
+            dict.get_item(&key)?
+                .ok_or_else(|| PyKeyError::new_err(key.clone().unbind()))
+        })
+        .collect()
+}
+
+#[inline]
+fn custom_flatten<'py>(
+    registration: &PyTreeTypeRegistration,
+    obj: &Bound<'py, PyAny>,
+) -> PyResult<(Vec<Bound<'py, PyAny>>, Bound<'py, PyAny>)> {
+    let py = obj.py();
+    let flatten_func = registration.flatten_func.as_ref().unwrap().bind(py);
+    let output = flatten_func.call1((obj,))?;
+    let output = match output.downcast::<PyTuple>() {
+        Ok(output) if output.len() == 2 || output.len() == 3 => output,
+        _ => {
+            return Err(PyTypeError::new_err(format!(
+                "PyTree custom flatten function for type {} should return \
+                a 2- or 3-tuple, got {}.",
+                registration.node_type.bind(py).repr()?,
+                output.repr()?
+            )));
+        }
     };
-    Ok(!(is_namedtuple_class(&cls)? || is_structseq_class(&cls)?))
+    let children = output
+        .get_item(0)?
+        .try_iter()?
+        .collect::<PyResult<Vec<_>>>()?;
+    Ok((children, output.get_item(1)?))
+}
+
+// An internal node whose children are being flattened
+struct Frame<'py> {
+    kind: PyTreeKind,
+    arity: usize,
+    items: std::vec::IntoIter<Bound<'py, PyAny>>,
+    node_data: Option<Bound<'py, PyAny>>,
+    registration: Option<Arc<PyTreeTypeRegistration>>,
+    num_leaves: usize,
+}
+
+struct Flattener<'a, 'py> {
+    leaf_predicate: Option<&'a Bound<'py, PyAny>>,
+    none_is_leaf: bool,
+    namespace: &'a str,
+    dict_insertion_ordered: bool,
+    // The results of the leaf predicate by object identity, only kept for the duration of the call
+    // if requested. The objects are kept alive so that their identities cannot be reused.
+    leaf_memo: Option<RefCell<HashMap<usize, (Bound<'py, PyAny>, bool)>>>,
+}
+
+impl<'a, 'py> Flattener<'a, 'py> {
+    #[inline]
+    fn new(
+        leaf_predicate: Option<&'a Bound<'py, PyAny>>,
+        none_is_leaf: Option<bool>,
+        namespace: Option<&'a str>,
+        memoize_is_leaf: Option<bool>,
+    ) -> Self {
+        let memoize_is_leaf = memoize_is_leaf.unwrap_or(false) && leaf_predicate.is_some();
+        Flattener {
+            leaf_predicate,
+            none_is_leaf: none_is_leaf.unwrap_or(false),
+            namespace: namespace.unwrap_or(""),
+            dict_insertion_ordered: PyTreeTypeRegistry::is_dict_insertion_ordered(
+                namespace,
+                Some(true),
+            ),
+            leaf_memo: memoize_is_leaf.then(|| RefCell::new(HashMap::new())),
+        }
+    }
+
+    #[inline]
+    fn into_treespec(self, mut traversal: Traversal) -> PyTreeSpec {
+        // The treespec may outlive the call by far, do not keep the spare capacity of the growth
+        traversal.shrink_to_fit();
+        PyTreeSpec {
+            traversal,
+            none_is_leaf: self.none_is_leaf,
+            namespace: String::from(self.namespace),
+        }
+    }
+
+    #[inline]
+    fn is_leaf_by_predicate(&self, obj: &Bound<'py, PyAny>) -> PyResult<bool> {
+        let Some(leaf_predicate) = self.leaf_predicate else {
+            return Ok(false);
+        };
+        let Some(leaf_memo) = &self.leaf_memo else {
+            return leaf_predicate.call1((obj,))?.is_truthy();
+        };
+
+        let key = obj.as_ptr() as usize;
+        if let Some((_, result)) = leaf_memo.borrow().get(&key) {
+            return Ok(*result);
+        }
+        // The memo is not borrowed during the call, the predicate may flatten other trees
+        let result = leaf_predicate.call1((obj,))?.is_truthy()?;
+        leaf_memo.borrow_mut().insert(key, (obj.clone(), result));
+        Ok(result)
+    }
+
+    #[inline]
+    fn dict_keys(&self, dict: &Bound<'py, PyDict>) -> PyResult<Bound<'py, PyTuple>> {
+        if self.dict_insertion_ordered {
+            Ok(dict.keys().to_tuple())
+        } else {
+            sorted_keys(dict)
+        }
+    }
+
+    // Returns the children to traverse and the metadata to store in the treespec.
+    fn children_of(
+        &self,
+        obj: &Bound<'py, PyAny>,
+        kind: PyTreeKind,
+        registration: Option<&PyTreeTypeRegistration>,
+    ) -> PyResult<(Vec<Bound<'py, PyAny>>, Option<Bound<'py, PyAny>>)> {
+        let py = obj.py();
+        Ok(match kind {
+            PyTreeKind::None => (Vec::new(), None),
+            PyTreeKind::Tuple => (obj.downcast::<PyTuple>()?.iter().collect(), None),
+            PyTreeKind::List => (obj.downcast::<PyList>()?.iter().collect(), None),
+            PyTreeKind::Dict | PyTreeKind::DefaultDict => {
+                let dict = obj.downcast::<PyDict>()?;
+                let keys = self.dict_keys(dict)?;
+                let values = dict_values(dict, &keys)?;
+                let keys = keys.into_any();
+                let node_data = if kind == PyTreeKind::DefaultDict {
+                    PyTuple::new(py, [obj.getattr("default_factory")?, keys])?.into_any()
+                } else {
+                    keys
+                };
+                (values, Some(node_data))
+            }
+            PyTreeKind::OrderedDict => {
+                // Iterate over the OrderedDict rather than the underlying dict to respect the order
+                let keys = PyTuple::new(py, obj.try_iter()?.collect::<PyResult<Vec<_>>>()?)?;
+                let values = dict_values(obj.downcast::<PyDict>()?, &keys)?;
+                (values, Some(keys.into_any()))
+            }
+            PyTreeKind::Deque => (
+                obj.try_iter()?.collect::<PyResult<Vec<_>>>()?,
+                Some(obj.getattr("maxlen")?),
+            ),
+            PyTreeKind::NamedTuple | PyTreeKind::StructSequence => (
+                obj.downcast::<PyTuple>()?.iter().collect(),
+                Some(obj.get_type().into_any()),
+            ),
+            PyTreeKind::Custom => {
+                let (children, node_data) = custom_flatten(registration.unwrap(), obj)?;
+                (children, Some(node_data))
+            }
+            PyTreeKind::Leaf => unreachable!("leaf nodes have no children"),
+        })
+    }
+
+    // Traverses the tree and appends the treespec nodes in post-order. `LEAVES` and `SPEC` select
+    // whether the leaves and the treespec nodes are collected, so that each entry point only pays
+    // for what it returns. Returns the number of leaves in the subtree.
+    //
+    // The traversal uses an explicit stack of the internal nodes being visited rather than
+    // recursion, so the depth limit is a check of the stack length instead of the native stack.
+    fn flatten_into<const LEAVES: bool, const SPEC: bool>(
+        &self,
+        obj: &Bound<'py, PyAny>,
+        leaves: &mut Vec<Bound<'py, PyAny>>,
+        traversal: &mut Traversal,
+        depth: usize,
+    ) -> PyResult<usize> {
+        let mut stack: Vec<Frame<'py>> = Vec::with_capacity(64);
+        let mut next = Some(obj.clone());
+        loop {
+            if let Some(obj) = next.take() {
+                if depth + stack.len() > MAX_RECURSION_DEPTH {
+                    return Err(PyRecursionError::new_err(
+                        "Maximum recursion depth exceeded during flattening the tree.",
+                    ));
+                }
+
+                let (kind, registration) = if self.is_leaf_by_predicate(&obj)? {
+                    (PyTreeKind::Leaf, None)
+                } else {
+                    get_kind(&obj, self.none_is_leaf, self.namespace)?
+                };
+                if kind == PyTreeKind::Leaf {
+                    if LEAVES {
+                        leaves.push(obj);
+                    }
+                    if SPEC {
+                        traversal.push_leaf();
+                    }
+                    match stack.last_mut() {
+                        Some(parent) => parent.num_leaves += 1,
+                        None => return Ok(1),
+                    }
+                } else {
+                    let (items, node_data) =
+                        self.children_of(&obj, kind, registration.as_deref())?;
+                    stack.push(Frame {
+                        kind,
+                        arity: items.len(),
+                        items: items.into_iter(),
+                        node_data,
+                        registration,
+                        num_leaves: 0,
+                    });
+                }
+            }
+
+            let frame = stack.last_mut().unwrap();
+            if let Some(item) = frame.items.next() {
+                next = Some(item);
+                continue;
+            }
+
+            // All children are visited, finish the node
+            let frame = stack.pop().unwrap();
+            if SPEC {
+                let registration = match frame.kind {
+                    PyTreeKind::Custom
+                    | PyTreeKind::OrderedDict
+                    | PyTreeKind::DefaultDict
+                    | PyTreeKind::Deque => frame.registration,
+                    _ => None,
+                };
+                traversal.push(
+                    frame.kind,
+                    frame.arity,
+                    frame.num_leaves,
+                    frame.node_data.map(Bound::unbind),
+                    registration,
+                )?;
+            }
+            match stack.last_mut() {
+                Some(parent) => parent.num_leaves += frame.num_leaves,
+                None => return Ok(frame.num_leaves),
+            }
+        }
+    }
+}
+
+impl Node<'_> {
+    // Returns the children of `obj` matched by this node. The node types, arities and node data are
+    // validated against the tree, but the kind of each node is known in advance so no registry
+    // lookup is needed.
+    fn children_up_to<'py>(&self, obj: &Bound<'py, PyAny>) -> PyResult<Vec<Bound<'py, PyAny>>> {
+        let py = obj.py();
+        // The metadata is only read by the node kinds that need it
+        let node_data = || self.node_data().unwrap().bind(py);
+        let registration = || self.registration().unwrap();
+        let expected_type = match self.kind {
+            PyTreeKind::None => py.get_type::<PyNone>().into_any(),
+            PyTreeKind::Tuple => py.get_type::<PyTuple>().into_any(),
+            PyTreeKind::List => py.get_type::<PyList>().into_any(),
+            PyTreeKind::Dict => py.get_type::<PyDict>().into_any(),
+            PyTreeKind::NamedTuple | PyTreeKind::StructSequence => node_data().clone(),
+            _ => registration().node_type.bind(py).clone().into_any(),
+        };
+        if obj.get_type().as_ptr() != expected_type.as_ptr() {
+            return Err(PyValueError::new_err(format!(
+                "Expected an instance of {}, got {}.",
+                expected_type.repr()?,
+                obj.repr()?
+            )));
+        }
+        match self.kind {
+            PyTreeKind::DefaultDict => {
+                let expected = node_data().get_item(0)?;
+                let default_factory = obj.getattr("default_factory")?;
+                if !default_factory.eq(&expected)? {
+                    return Err(PyValueError::new_err(format!(
+                        "Mismatch default factory of defaultdict; expected: {}, got: {}.",
+                        expected.repr()?,
+                        default_factory.repr()?
+                    )));
+                }
+            }
+            PyTreeKind::Deque => {
+                let expected = node_data();
+                let maxlen = obj.getattr("maxlen")?;
+                if !maxlen.eq(expected)? {
+                    return Err(PyValueError::new_err(format!(
+                        "Mismatch maximum length of deque; expected: {}, got: {}.",
+                        expected.repr()?,
+                        maxlen.repr()?
+                    )));
+                }
+            }
+            _ => {}
+        }
+
+        let children = match self.kind {
+            PyTreeKind::None => Vec::new(),
+            PyTreeKind::Tuple
+            | PyTreeKind::List
+            | PyTreeKind::Deque
+            | PyTreeKind::NamedTuple
+            | PyTreeKind::StructSequence => obj.try_iter()?.collect::<PyResult<Vec<_>>>()?,
+            PyTreeKind::Dict | PyTreeKind::OrderedDict | PyTreeKind::DefaultDict => {
+                let keys = match self.kind {
+                    PyTreeKind::DefaultDict => node_data().get_item(1)?,
+                    _ => node_data().clone(),
+                };
+                let dict = obj.downcast::<PyDict>()?;
+                let key_mismatch = || -> PyResult<PyErr> {
+                    Ok(PyValueError::new_err(format!(
+                        "Dictionary key mismatch; expected key(s): {}, got key(s): {}.",
+                        keys.repr()?,
+                        dict.keys().repr()?
+                    )))
+                };
+                if dict.len() != self.arity {
+                    return Err(key_mismatch()?);
+                }
+                let mut values = Vec::with_capacity(self.arity);
+                for key in keys.try_iter()? {
+                    match dict.get_item(key?)? {
+                        Some(value) => values.push(value),
+                        None => return Err(key_mismatch()?),
+                    }
+                }
+                values
+            }
+            PyTreeKind::Custom => {
+                let (children, metadata) = custom_flatten(registration(), obj)?;
+                if !metadata.eq(node_data())? {
+                    return Err(PyValueError::new_err(format!(
+                        "Mismatch custom node data; expected: {}, got: {}.",
+                        node_data().repr()?,
+                        metadata.repr()?
+                    )));
+                }
+                children
+            }
+            PyTreeKind::Leaf => unreachable!("leaf nodes are handled by the caller"),
+        };
+        if children.len() != self.arity {
+            return Err(PyValueError::new_err(format!(
+                "Node arity mismatch; expected: {}, got: {}; value: {}.",
+                self.arity,
+                children.len(),
+                obj.repr()?
+            )));
+        }
+        Ok(children)
+    }
+}
+
+impl PyTreeSpec {
+    pub(super) fn flatten_up_to_impl<'py>(
+        &self,
+        tree: &Bound<'py, PyAny>,
+    ) -> PyResult<Bound<'py, PyList>> {
+        // Walk the post-order traversal backwards, i.e., the root first and the last child of each
+        // node before its siblings. The children are pushed in order so that the top of the stack
+        // always matches the next node and the leaves are collected in reverse.
+        let mut leaves = Vec::with_capacity(self.root().num_leaves());
+        let mut stack = vec![tree.clone()];
+        for (index, &kind) in self.traversal.kinds.iter().enumerate().rev() {
+            let obj = stack.pop().unwrap();
+            if kind == PyTreeKind::Leaf {
+                leaves.push(obj);
+            } else {
+                stack.extend(self.traversal.node(index).children_up_to(&obj)?);
+            }
+        }
+        leaves.reverse();
+        new_list(tree.py(), leaves)
+    }
+}
+
+/// Flatten a pytree.
+///
+/// See also :func:`tree_leaves`, :func:`tree_structure`, and :func:`tree_unflatten`.
+///
+/// The flattening order (i.e., the order of elements in the output list) is deterministic,
+/// corresponding to a left-to-right depth-first tree traversal. The keys of :class:`dict` nodes are
+/// sorted before traversal unless the namespace is :func:`dict_insertion_ordered`.
+///
+/// >>> tree = {'b': (2, [3, 4]), 'a': 1, 'c': None, 'd': 5}
+/// >>> tree_flatten(tree)  # doctest: +IGNORE_WHITESPACE
+/// (
+///     [1, 2, 3, 4, 5],
+///     PyTreeSpec({'a': *, 'b': (*, [*, *]), 'c': None, 'd': *})
+/// )
+/// >>> tree_flatten(tree, none_is_leaf=True)  # doctest: +IGNORE_WHITESPACE
+/// (
+///     [1, 2, 3, 4, None, 5],
+///     PyTreeSpec({'a': *, 'b': (*, [*, *]), 'c': *, 'd': *}, NoneIsLeaf)
+/// )
+/// >>> tree_flatten(1)
+/// ([1], PyTreeSpec(*))
+/// >>> tree_flatten(None)
+/// ([], PyTreeSpec(None))
+///
+/// Args:
+///     tree (pytree): A pytree to flatten.
+///     is_leaf (callable, optional): An optionally specified function that will be called at each
+///         flattening step. It should return a boolean, with :data:`True` stopping the traversal
+///         and the whole subtree being treated as a leaf, and :data:`False` indicating the
+///         flattening should traverse the current object.
+///     none_is_leaf (bool, optional): Whether to treat :data:`None` as a leaf. If :data:`False`,
+///         :data:`None` is a non-leaf node with arity 0. Thus :data:`None` is contained in the
+///         treespec rather than in the leaves list. (default: :data:`False`)
+///     namespace (str, optional): The registry namespace used for custom pytree node types.
+///         (default: :const:`''`, i.e., the global namespace)
+///     memoize_is_leaf (bool, optional): Whether to cache the result of ``is_leaf`` by object
+///         identity during the call, so that an object reachable from several places in the tree
+///         is only tested once. Only enable it if ``is_leaf`` depends on the object alone.
+///         (default: :data:`False`)
+///
+/// Returns:
+///     A pair ``(leaves, treespec)`` where the first element is a list of leaf values and the
+///     second element is a treespec representing the structure of the pytree.
+#[pyfunction]
+#[pyo3(
+    signature = (tree, /, is_leaf=None, *, none_is_leaf=false, namespace="", memoize_is_leaf=false)
+)]
+#[inline]
+pub fn flatten<'py>(
+    tree: &Bound<'py, PyAny>,
+    is_leaf: Option<&Bound<'py, PyAny>>,
+    none_is_leaf: Option<bool>,
+    namespace: Option<&str>,
+    memoize_is_leaf: Option<bool>,
+) -> PyResult<(Bound<'py, PyList>, Bound<'py, PyTreeSpec>)> {
+    let py = tree.py();
+    let flattener = Flattener::new(is_leaf, none_is_leaf, namespace, memoize_is_leaf);
+    let mut leaves = Vec::with_capacity(reserved_capacity());
+    let mut traversal = Traversal::default();
+    flattener.flatten_into::<true, true>(tree, &mut leaves, &mut traversal, 0)?;
+    record(leaves.len());
+    Ok((
+        new_list(py, leaves)?,
+        Bound::new(py, flattener.into_treespec(traversal))?,
+    ))
+}
+
+/// Get the leaves of a pytree.
+///
+/// See also :func:`tree_flatten`.
+///
+/// This is faster than ``tree_flatten(tree)[0]`` since no treespec is constructed.
+///
+/// >>> tree = {'b': (2, [3, 4]), 'a': 1, 'c': None, 'd': 5}
+/// >>> tree_leaves(tree)
+/// [1, 2, 3, 4, 5]
+/// >>> tree_leaves(tree, none_is_leaf=True)
+/// [1, 2, 3, 4, None, 5]
+/// >>> tree_leaves(1)
+/// [1]
+/// >>> tree_leaves(None)
+/// []
+///
+/// With ``memoize_is_leaf=True``, ``is_leaf`` is called once per distinct object. Here the shared
+/// list and its items are only tested once rather than at each of their three occurrences:
+///
+/// >>> calls = []
+/// >>> def never_leaf(obj):
+/// ...     calls.append(obj)
+/// ...     return False
+/// >>> shared = [1, 2]
+/// >>> tree = [shared, shared, shared]
+/// >>> tree_leaves(tree, never_leaf)
+/// [1, 2, 1, 2, 1, 2]
+/// >>> len(calls)
+/// 10
+/// >>> calls.clear()
+/// >>> tree_leaves(tree, never_leaf, memoize_is_leaf=True)
+/// [1, 2, 1, 2, 1, 2]
+/// >>> len(calls)
+/// 4
+///
+/// Args:
+///     tree (pytree): A pytree to iterate over.
+///     is_leaf (callable, optional): An optionally specified function that will be called at each
+///         flattening step. It should return a boolean, with :data:`True` stopping the traversal
+///         and the whole subtree being treated as a leaf, and :data:`False` indicating the
+///         flattening should traverse the current object.
+///     none_is_leaf (bool, optional): Whether to treat :data:`None` as a leaf. If :data:`False`,
+///         :data:`None` is a non-leaf node with arity 0. Thus :data:`None` is contained in the
+///         treespec rather than in the leaves list. (default: :data:`False`)
+///     namespace (str, optional): The registry namespace used for custom pytree node types.
+///         (default: :const:`''`, i.e., the global namespace)
+///     memoize_is_leaf (bool, optional): Whether to cache the result of ``is_leaf`` by object
+///         identity during the call, so that an object reachable from several places in the tree
+///         is only tested once. Only enable it if ``is_leaf`` depends on the object alone.
+///         (default: :data:`False`)
+///
+/// Returns:
+///     A list of leaf values.
+#[pyfunction]
+#[pyo3(
+    signature = (tree, /, is_leaf=None, *, none_is_leaf=false, namespace="", memoize_is_leaf=false)
+)]
+#[inline]
+pub fn leaves<'py>(
+    tree: &Bound<'py, PyAny>,
+    is_leaf: Option<&Bound<'py, PyAny>>,
+    none_is_leaf: Option<bool>,
+    namespace: Option<&str>,
+    memoize_is_leaf: Option<bool>,
+) -> PyResult<Bound<'py, PyList>> {
+    let flattener = Flattener::new(is_leaf, none_is_leaf, namespace, memoize_is_leaf);
+    let mut leaves = Vec::with_capacity(reserved_capacity());
+    flattener.flatten_into::<true, false>(tree, &mut leaves, &mut Traversal::default(), 0)?;
+    record(leaves.len());
+    new_list(tree.py(), leaves)
+}
+
+/// Get the treespec for a pytree.
+///
+/// See also :func:`tree_flatten`.
+///
+/// This is faster than ``tree_flatten(tree)[1]`` since the leaves are not collected.
+///
+/// >>> tree = {'b': (2, [3, 4]), 'a': 1, 'c': None, 'd': 5}
+/// >>> tree_structure(tree)
+/// PyTreeSpec({'a': *, 'b': (*, [*, *]), 'c': None, 'd': *})
+/// >>> tree_structure(tree, none_is_leaf=True)
+/// PyTreeSpec({'a': *, 'b': (*, [*, *]), 'c': *, 'd': *}, NoneIsLeaf)
+/// >>> tree_structure(1)
+/// PyTreeSpec(*)
+/// >>> tree_structure(None)
+/// PyTreeSpec(None)
+///
+/// Args:
+///     tree (pytree): A pytree to flatten.
+///     is_leaf (callable, optional): An optionally specified function that will be called at each
+///         flattening step. It should return a boolean, with :data:`True` stopping the traversal
+///         and the whole subtree being treated as a leaf, and :data:`False` indicating the
+///         flattening should traverse the current object.
+///     none_is_leaf (bool, optional): Whether to treat :data:`None` as a leaf. If :data:`False`,
+///         :data:`None` is a non-leaf node with arity 0. Thus :data:`None` is contained in the
+///         treespec rather than in the leaves list. (default: :data:`False`)
+///     namespace (str, optional): The registry namespace used for custom pytree node types.
+///         (default: :const:`''`, i.e., the global namespace)
+///     memoize_is_leaf (bool, optional): Whether to cache the result of ``is_leaf`` by object
+///         identity during the call, so that an object reachable from several places in the tree
+///         is only tested once. Only enable it if ``is_leaf`` depends on the object alone.
+///         (default: :data:`False`)
+///
+/// Returns:
+///     A treespec object representing the structure of the pytree.
+#[pyfunction]
+#[pyo3(
+    signature = (tree, /, is_leaf=None, *, none_is_leaf=false, namespace="", memoize_is_leaf=false)
+)]
+#[inline]
+pub fn structure<'py>(
+    tree: &Bound<'py, PyAny>,
+    is_leaf: Option<&Bound<'py, PyAny>>,
+    none_is_leaf: Option<bool>,
+    namespace: Option<&str>,
+    memoize_is_leaf: Option<bool>,
+) -> PyResult<Bound<'py, PyTreeSpec>> {
+    let flattener = Flattener::new(is_leaf, none_is_leaf, namespace, memoize_is_leaf);
+    let mut traversal = Traversal::default();
+    flattener.flatten_into::<false, true>(tree, &mut Vec::new(), &mut traversal, 0)?;
+    Bound::new(tree.py(), flattener.into_treespec(traversal))
+}
+
+/// Get the leaves of the positional and keyword arguments of a function call.
+#[pyfunction]
+#[pyo3(signature = (args, kwargs, /, *, none_is_leaf=false, namespace=""))]
+#[inline]
+pub fn arg_leaves<'py>(
+    args: &Bound<'py, PyTuple>,
+    kwargs: &Bound<'py, PyDict>,
+    none_is_leaf: Option<bool>,
+    namespace: Option<&str>,
+) -> PyResult<Bound<'py, PyList>> {
+    // Same result as `leaves((args, kwargs))` without building the outer containers: the
+    // positional arguments and the values of the sorted keyword arguments are flattened directly
+    // at the depth they would have in the `(args, kwargs)` pair. There is no leaf predicate, which
+    // could otherwise match the outer containers that are never visited here.
+    let flattener = Flattener::new(None, none_is_leaf, namespace, None);
+    // The arguments of a call are usually few and shallow, so the hint of the last flattened tree
+    // is neither used nor updated
+    let mut leaves = Vec::with_capacity(args.len() + kwargs.len());
+    let mut traversal = Traversal::default();
+    for arg in args.iter() {
+        flattener.flatten_into::<true, false>(&arg, &mut leaves, &mut traversal, 2)?;
+    }
+    let keys = flattener.dict_keys(kwargs)?;
+    for value in dict_values(kwargs, &keys)? {
+        flattener.flatten_into::<true, false>(&value, &mut leaves, &mut traversal, 2)?;
+    }
+    new_list(args.py(), leaves)
 }
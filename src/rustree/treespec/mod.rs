@@ -14,5 +14,376 @@
 // =============================================================================
 
 mod flatten;
+mod unflatten;
 
-pub use flatten::is_leaf;
+use pyo3::exceptions::PyOverflowError;
+use pyo3::ffi;
+use pyo3::prelude::*;
+use pyo3::types::*;
+use std::hash::{DefaultHasher, Hash, Hasher};
+use std::sync::Arc;
+
+use crate::rustree::pytypes::{namedtuple_fields, structseq_fields};
+use crate::rustree::registry::{PyTreeKind, PyTreeTypeRegistration};
+
+pub use flatten::{arg_leaves, flatten, is_leaf, leaves, structure};
+
+// Build a list that takes the ownership of the given items. The list is allocated at its final
+// size with `PyList_New` and filled with `PyList_SET_ITEM`, which steals the reference of each
+// item, so no reference counts are touched and no bounds are checked per item.
+#[inline]
+fn new_list<'py>(py: Python<'py>, items: Vec<Bound<'py, PyAny>>) -> PyResult<Bound<'py, PyList>> {
+    unsafe {
+        let list =
+            Bound::from_owned_ptr_or_err(py, ffi::PyList_New(items.len() as ffi::Py_ssize_t))?
+                .downcast_into_unchecked::<PyList>();
+        for (index, item) in items.into_iter().enumerate() {
+            ffi::PyList_SET_ITEM(list.as_ptr(), index as ffi::Py_ssize_t, item.into_ptr());
+        }
+        Ok(list)
+    }
+}
+
+// The nodes of a treespec in post-order, i.e., the children of a node are the `arity` subtrees
+// right before it and the root is the last node. The nodes are stored as a struct of arrays so
+// that the hot loops over the kinds and arities read dense arrays, while the Python objects are
+// only touched for the nodes that need them. The counts are stored as `u32` to keep the arrays
+// compact.
+#[derive(Default)]
+struct Traversal {
+    kinds: Vec<PyTreeKind>,
+    arities: Vec<u32>,
+    num_leaves: Vec<u32>,
+    // Kind-specific metadata, e.g., the sorted keys of a dict or the type of a namedtuple
+    node_data: Vec<Option<Py<PyAny>>>,
+    // Only set for node types that need the registered functions or type to unflatten
+    registrations: Vec<Option<Arc<PyTreeTypeRegistration>>>,
+}
+
+// Leaves and the built-in sequence nodes keep neither node data nor a registration
+#[inline]
+fn has_metadata(kind: PyTreeKind) -> bool {
+    !matches!(
+        kind,
+        PyTreeKind::Leaf | PyTreeKind::None | PyTreeKind::Tuple | PyTreeKind::List
+    )
+}
+
+#[inline]
+fn to_u32(count: usize) -> PyResult<u32> {
+    u32::try_from(count)
+        .map_err(|_| PyOverflowError::new_err("The pytree is too large to build a treespec."))
+}
+
+impl Traversal {
+    // The vectors grow by doubling while the tree is flattened, release the spare capacity once
+    // the traversal is complete
+    fn shrink_to_fit(&mut self) {
+        self.kinds.shrink_to_fit();
+        self.arities.shrink_to_fit();
+        self.num_leaves.shrink_to_fit();
+        self.node_data.shrink_to_fit();
+        self.registrations.shrink_to_fit();
+    }
+
+    #[inline]
+    fn len(&self) -> usize {
+        self.kinds.len()
+    }
+
+    #[inline]
+    fn push_leaf(&mut self) {
+        self.kinds.push(PyTreeKind::Leaf);
+        self.arities.push(0);
+        self.num_leaves.push(1);
+        self.node_data.push(None);
+        self.registrations.push(None);
+    }
+
+    #[inline]
+    fn push(
+        &mut self,
+        kind: PyTreeKind,
+        arity: usize,
+        num_leaves: usize,
+        node_data: Option<Py<PyAny>>,
+        registration: Option<Arc<PyTreeTypeRegistration>>,
+    ) -> PyResult<()> {
+        let (arity, num_leaves) = (to_u32(arity)?, to_u32(num_leaves)?);
+        self.kinds.push(kind);
+        self.arities.push(arity);
+        self.num_leaves.push(num_leaves);
+        self.node_data.push(node_data);
+        self.registrations.push(registration);
+        Ok(())
+    }
+
+    #[inline]
+    fn node(&self, index: usize) -> Node<'_> {
+        Node {
+            traversal: self,
+            index,
+            kind: self.kinds[index],
+            arity: self.arities[index] as usize,
+        }
+    }
+
+    #[inline]
+    fn iter(&self) -> impl Iterator<Item = Node<'_>> {
+        (0..self.len()).map(|index| self.node(index))
+    }
+}
+
+// A view of a single node of the traversal. Only the kind and the arity are read up front, the
+// other fields are read on demand by the node kinds that use them.
+#[derive(Clone, Copy)]
+struct Node<'a> {
+    traversal: &'a Traversal,
+    index: usize,
+    kind: PyTreeKind,
+    arity: usize,
+}
+
+impl<'a> Node<'a> {
+    #[inline]
+    fn num_leaves(&self) -> usize {
+        self.traversal.num_leaves[self.index] as usize
+    }
+
+    #[inline]
+    fn node_data(&self) -> Option<&'a Py<PyAny>> {
+        self.traversal.node_data[self.index].as_ref()
+    }
+
+    #[inline]
+    fn registration(&self) -> Option<&'a PyTreeTypeRegistration> {
+        self.traversal.registrations[self.index].as_deref()
+    }
+}
+
+impl Node<'_> {
+    // The kinds, arities and counts are compared by the caller
+    fn equal_data(&self, other: &Node, py: Python<'_>) -> PyResult<bool> {
+        match (self.registration(), other.registration()) {
+            (Some(a), Some(b)) if a.node_type.as_ptr() != b.node_type.as_ptr() => return Ok(false),
+            (Some(_), None) | (None, Some(_)) => return Ok(false),
+            _ => {}
+        }
+        match (self.node_data(), other.node_data()) {
+            (Some(a), Some(b)) => a.bind(py).eq(b.bind(py)),
+            (None, None) => Ok(true),
+            _ => Ok(false),
+        }
+    }
+
+    // The kinds and arities are hashed by the caller
+    fn hash_data_into<H: Hasher>(&self, py: Python<'_>, state: &mut H) -> PyResult<()> {
+        if let Some(registration) = self.registration() {
+            registration.node_type.as_ptr().hash(state);
+        }
+        if let Some(node_data) = self.node_data() {
+            node_data.bind(py).hash()?.hash(state);
+        }
+        Ok(())
+    }
+
+    fn repr(&self, py: Python<'_>, children: &[String]) -> PyResult<String> {
+        let node_data = self.node_data().map(|node_data| node_data.bind(py));
+        let dict_repr = |keys: &Bound<'_, PyAny>| -> PyResult<String> {
+            let items = keys
+                .try_iter()?
+                .zip(children.iter())
+                .map(|(key, child)| Ok(format!("{}: {}", key?.repr()?, child)))
+                .collect::<PyResult<Vec<String>>>()?;
+            Ok(format!("{{{}}}", items.join(", ")))
+        };
+        let fields_repr = |fields: &Bound<'_, PyTuple>| -> String {
+            fields
+                .iter()
+                .zip(children.iter())
+                .map(|(field, child)| format!("{}={}", field, child))
+                .collect::<Vec<String>>()
+                .join(", ")
+        };
+
+        Ok(match self.kind {
+            PyTreeKind::Leaf => String::from("*"),
+            PyTreeKind::None => String::from("None"),
+            PyTreeKind::Tuple if self.arity == 1 => format!("({},)", children[0]),
+            PyTreeKind::Tuple => format!("({})", children.join(", ")),
+            PyTreeKind::List => format!("[{}]", children.join(", ")),
+            PyTreeKind::Dict => dict_repr(node_data.unwrap())?,
+            PyTreeKind::OrderedDict => format!("OrderedDict({})", dict_repr(node_data.unwrap())?),
+            PyTreeKind::DefaultDict => {
+                let node_data = node_data.unwrap();
+                format!(
+                    "defaultdict({}, {})",
+                    node_data.get_item(0)?.repr()?,
+                    dict_repr(&node_data.get_item(1)?)?
+                )
+            }
+            PyTreeKind::Deque => {
+                let maxlen = node_data.unwrap();
+                if maxlen.is_none() {
+                    format!("deque([{}])", children.join(", "))
+                } else {
+                    format!("deque([{}], maxlen={})", children.join(", "), maxlen)
+                }
+            }
+            PyTreeKind::NamedTuple => {
+                let cls = node_data.unwrap();
+                format!(
+                    "{}({})",
+                    cls.getattr("__qualname__")?,
+                    fields_repr(&namedtuple_fields(cls)?)
+                )
+            }
+            PyTreeKind::StructSequence => {
+                let cls = node_data.unwrap();
+                format!(
+                    "{}.{}({})",
+                    cls.getattr("__module__")?,
+                    cls.getattr("__qualname__")?,
+                    fields_repr(&structseq_fields(cls)?)
+                )
+            }
+            PyTreeKind::Custom => {
+                let node_type = self.registration().unwrap().node_type.bind(py);
+                let node_data = match node_data {
+                    Some(node_data) => node_data.repr()?.to_string(),
+                    None => String::from("None"),
+                };
+                format!(
+                    "CustomTreeNode({}[{}], [{}])",
+                    node_type.getattr("__qualname__")?,
+                    node_data,
+                    children.join(", ")
+                )
+            }
+        })
+    }
+}
+
+#[pyclass(frozen, module = "rustree", name = "PyTreeSpec")]
+pub struct PyTreeSpec {
+    traversal: Traversal,
+    none_is_leaf: bool,
+    namespace: String,
+}
+
+impl PyTreeSpec {
+    #[inline]
+    fn root(&self) -> Node<'_> {
+        self.traversal.node(self.traversal.len() - 1)
+    }
+}
+
+#[pymethods]
+impl PyTreeSpec {
+    #[getter]
+    fn num_leaves(&self) -> usize {
+        self.root().num_leaves()
+    }
+
+    #[getter]
+    fn num_nodes(&self) -> usize {
+        self.traversal.len()
+    }
+
+    #[getter]
+    fn num_children(&self) -> usize {
+        self.root().arity
+    }
+
+    #[getter]
+    fn none_is_leaf(&self) -> bool {
+        self.none_is_leaf
+    }
+
+    #[getter]
+    fn namespace(&self) -> &str {
+        &self.namespace
+    }
+
+    #[getter]
+    fn kind(&self) -> PyTreeKind {
+        self.root().kind
+    }
+
+    #[pyo3(signature = (full_tree, /))]
+    fn flatten_up_to<'py>(&self, full_tree: &Bound<'py, PyAny>) -> PyResult<Bound<'py, PyList>> {
+        self.flatten_up_to_impl(full_tree)
+    }
+
+    #[pyo3(signature = (leaves, /))]
+    fn unflatten<'py>(&self, leaves: &Bound<'py, PyAny>) -> PyResult<Bound<'py, PyAny>> {
+        self.unflatten_impl(leaves)
+    }
+
+    fn __len__(&self) -> usize {
+        self.root().num_leaves()
+    }
+
+    fn __eq__(&self, other: &Bound<'_, PyAny>) -> PyResult<bool> {
+        match other.downcast::<PyTreeSpec>() {
+            Ok(other) => {
+                let py = other.py();
+                let other = other.get();
+                // The leaf counts are determined by the kinds and arities in post-order
+                let (a, b) = (&self.traversal, &other.traversal);
+                if self.none_is_leaf != other.none_is_leaf
+                    || self.namespace != other.namespace
+                    || a.kinds != b.kinds
+                    || a.arities != b.arities
+                {
+                    return Ok(false);
+                }
+                // Only the nodes with metadata are compared further, the others are fully
+                // determined by their kinds and arities
+                for (index, &kind) in a.kinds.iter().enumerate() {
+                    if has_metadata(kind) && !a.node(index).equal_data(&b.node(index), py)? {
+                        return Ok(false);
+                    }
+                }
+                Ok(true)
+            }
+            Err(_) => Ok(false),
+        }
+    }
+
+    fn __hash__(&self, py: Python<'_>) -> PyResult<isize> {
+        let mut state = DefaultHasher::new();
+        self.none_is_leaf.hash(&mut state);
+        self.namespace.hash(&mut state);
+        for kind in &self.traversal.kinds {
+            (*kind as u8).hash(&mut state);
+        }
+        self.traversal.arities.hash(&mut state);
+        for (index, &kind) in self.traversal.kinds.iter().enumerate() {
+            if has_metadata(kind) {
+                self.traversal.node(index).hash_data_into(py, &mut state)?;
+            }
+        }
+        Ok(state.finish() as isize)
+    }
+
+    fn __repr__(&self, py: Python<'_>) -> PyResult<String> {
+        let mut stack: Vec<String> = Vec::with_capacity(self.traversal.len());
+        for node in self.traversal.iter() {
+            let children = stack.split_off(stack.len() - node.arity);
+            stack.push(node.repr(py, &children)?);
+        }
+        let mut repr = format!("PyTreeSpec({}", stack.pop().unwrap());
+        if self.none_is_leaf {
+            repr.push_str(", NoneIsLeaf");
+        }
+        if !self.namespace.is_empty() {
+            repr.push_str(&format!(
+                ", namespace={}",
+                PyString::new(py, &self.namespace).repr()?
+            ));
+        }
+        repr.push(')');
+        Ok(repr)
+    }
+}
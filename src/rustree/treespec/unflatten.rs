@@ -0,0 +1,113 @@
+// Copyright 2024-2025 Xuehai Pan. All Rights Reserved.
+//
+// Licensed under the Apache License, Version 2.0 (the "License");
+// you may not use this file except in compliance with the License.
+// You may obtain a copy of the License at
+//
+//     http://www.apache.org/licenses/LICENSE-2.0
+//
+// Unless required by applicable law or agreed to in writing, software
+// distributed under the License is distributed on an "AS IS" BASIS,
+// WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+// See the License for the specific language governing permissions and
+// limitations under the License.
+// =============================================================================
+
+use pyo3::exceptions::PyValueError;
+use pyo3::prelude::*;
+use pyo3::types::*;
+
+use crate::rustree::registry::PyTreeKind;
+use crate::rustree::treespec::{Node, PyTreeSpec, new_list};
+
+impl Node<'_> {
+    // Build the container of an internal node from its already unflattened children
+    fn make_node<'py>(
+        &self,
+        py: Python<'py>,
+        children: Vec<Bound<'py, PyAny>>,
+    ) -> PyResult<Bound<'py, PyAny>> {
+        // The metadata is only read by the node kinds that need it
+        let node_data = || self.node_data().unwrap().bind(py);
+        let node_type = || self.registration().unwrap().node_type.bind(py);
+
+        Ok(match self.kind {
+            PyTreeKind::None => py.None().into_bound(py),
+            PyTreeKind::Tuple => PyTuple::new(py, children)?.into_any(),
+            PyTreeKind::List => new_list(py, children)?.into_any(),
+            PyTreeKind::Dict => {
+                let dict = PyDict::new(py);
+                for (key, value) in node_data().try_iter()?.zip(children) {
+                    dict.set_item(key?, value)?;
+                }
+                dict.into_any()
+            }
+            PyTreeKind::OrderedDict => {
+                let dict = node_type().call0()?;
+                for (key, value) in node_data().try_iter()?.zip(children) {
+                    dict.set_item(key?, value)?;
+                }
+                dict
+            }
+            PyTreeKind::DefaultDict => {
+                let node_data = node_data();
+                let dict = node_type().call1((node_data.get_item(0)?,))?;
+                for (key, value) in node_data.get_item(1)?.try_iter()?.zip(children) {
+                    dict.set_item(key?, value)?;
+                }
+                dict
+            }
+            PyTreeKind::Deque => node_type().call1((new_list(py, children)?, node_data()))?,
+            PyTreeKind::NamedTuple => node_data().call1(PyTuple::new(py, children)?)?,
+            PyTreeKind::StructSequence => node_data().call1((PyTuple::new(py, children)?,))?,
+            PyTreeKind::Custom => {
+                let unflatten_func = self
+                    .registration()
+                    .unwrap()
+                    .unflatten_func
+                    .as_ref()
+                    .unwrap()
+                    .bind(py);
+                unflatten_func.call1((node_data(), PyTuple::new(py, children)?))?
+            }
+            PyTreeKind::Leaf => unreachable!("leaf nodes are handled by the caller"),
+        })
+    }
+}
+
+impl PyTreeSpec {
+    pub(super) fn unflatten_impl<'py>(
+        &self,
+        leaves: &Bound<'py, PyAny>,
+    ) -> PyResult<Bound<'py, PyAny>> {
+        let py = leaves.py();
+        let leaves = leaves.try_iter()?.collect::<PyResult<Vec<_>>>()?;
+        let num_leaves = self.root().num_leaves();
+        if leaves.len() != num_leaves {
+            return Err(PyValueError::new_err(format!(
+                "Too {} leaves for PyTreeSpec; expected {}, got {}.",
+                if leaves.len() < num_leaves {
+                    "few"
+                } else {
+                    "many"
+                },
+                num_leaves,
+                leaves.len()
+            )));
+        }
+
+        // The traversal is in post-order, so the children of a node are always on top of the stack
+        let mut leaves = leaves.into_iter();
+        let mut stack: Vec<Bound<'py, PyAny>> = Vec::with_capacity(self.traversal.len());
+        for (index, &kind) in self.traversal.kinds.iter().enumerate() {
+            if kind == PyTreeKind::Leaf {
+                stack.push(leaves.next().unwrap());
+            } else {
+                let node = self.traversal.node(index);
+                let children = stack.split_off(stack.len() - node.arity);
+                stack.push(node.make_node(py, children)?);
+            }
+        }
+        Ok(stack.pop().unwrap())
+    }
+}